@@ -1,14 +1,31 @@
 """
 Enhanced on-chain indexer with:
-- compressed postings lists (delta + simple varint)
+- compressed postings lists (delta + fixed-width bitpacking)
 - boolean queries: AND (intersection) and OR (merge)
 """
 
-import sqlite3, json, hashlib, struct, os
+import sqlite3, json, os
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Iterator
 
+import mmh3
+import numpy as np
+
+_VARINT_SMALL = [bytes((i,)) for i in range(128)]
+
+# interned keys for the small integer topic space; avoids a str.format
+# per topic-occurrence during indexing
+TOPIC_KEYS = [f"topic:{i}" for i in range(128)]
+
+def topic_key(topic) -> str:
+    if isinstance(topic, int) and 0 <= topic < len(TOPIC_KEYS):
+        return TOPIC_KEYS[topic]
+    return f"topic:{topic}"
+
 def varint_encode(n: int) -> bytes:
+    if 0 <= n < 128:
+        return _VARINT_SMALL[n]
     out = bytearray()
     while True:
         towrite = n & 0x7F
@@ -35,59 +52,83 @@ def varint_decode_stream(b: bytes) -> Iterator[int]:
             shift += 7
         yield val
 
-def compress_postings(block_numbers: List[int]) -> bytes:
-    if not block_numbers:
-        return b""
+def encode_shard_ids(shard_ids: List[int]) -> bytes:
     out = bytearray()
     prev = 0
-    for b in block_numbers:
-        delta = b - prev
-        out.extend(varint_encode(delta))
-        prev = b
+    for sid in sorted(shard_ids):
+        out.extend(varint_encode(sid - prev))
+        prev = sid
     return bytes(out)
 
-def decompress_postings(b: bytes) -> List[int]:
-    res = []
+def decode_shard_ids(b: bytes) -> List[int]:
+    ids = []
     prev = 0
     for delta in varint_decode_stream(b):
-        val = prev + delta
-        res.append(val)
-        prev = val
-    return res
+        prev += delta
+        ids.append(prev)
+    return ids
+
+def compress_postings(block_numbers: List[int]) -> bytes:
+    # layout: uint32 count, uint8 bits_per_value, then the deltas bitpacked
+    # big-endian at fixed width (7 bits covers a shard_size-100 shard)
+    if len(block_numbers) == 0:
+        return b""
+    blocks = np.asarray(block_numbers, np.int64)
+    deltas = np.diff(blocks, prepend=0).astype(np.uint32)
+    bpv = max(int(deltas.max()).bit_length(), 1)
+    bits = ((deltas[:, None] >> np.arange(bpv - 1, -1, -1)) & 1).astype(np.uint8)
+    packed = np.packbits(bits.ravel())
+    return len(blocks).to_bytes(4, 'little') + bytes((bpv,)) + packed.tobytes()
+
+def postings_count(b: bytes) -> int:
+    return int.from_bytes(b[:4], 'little') if b else 0
+
+def decode_postings_into(b: bytes, out: np.ndarray, pos: int) -> int:
+    # fused unpack + prefix sum straight into out[pos:]; returns the new pos
+    n = int.from_bytes(b[:4], 'little')
+    bpv = b[4]
+    bits = np.unpackbits(np.frombuffer(b, np.uint8, offset=5), count=n * bpv)
+    weights = (1 << np.arange(bpv - 1, -1, -1)).astype(np.uint32)
+    np.cumsum(bits.reshape(n, bpv) @ weights, out=out[pos:pos + n])
+    return pos + n
+
+def decompress_postings(b: bytes) -> np.ndarray:
+    out = np.empty(postings_count(b), np.uint32)
+    if len(out):
+        decode_postings_into(b, out, 0)
+    return out
+
+def bloom_positions(key: bytes, m: int, k: int) -> List[int]:
+    # Kirsch-Mitzenmacher double hashing: one murmur hash instead of k SHA-256s
+    h1, h2 = mmh3.hash64(key, signed=False)
+    return [(h1 + i * h2) % m for i in range(k)]
 
 class BloomFilter:
     def __init__(self, m_bits=8192, k=6):
-        import hashlib, struct
         self.m = m_bits
         self.k = k
-        self.bitarr = 0
+        self.buf = bytearray((m_bits + 7) // 8)
 
     def _hashes(self, key: bytes):
-        import hashlib, struct
-        h = hashlib.sha256(key).digest()
-        for i in range(self.k):
-            start = (i*8) % (len(h)-7)
-            val = struct.unpack_from(">Q", h, start)[0]
-            yield val % self.m
+        return bloom_positions(key, self.m, self.k)
 
     def add(self, key: str):
         for pos in self._hashes(key.encode('utf-8')):
-            self.bitarr |= (1 << pos)
+            self.buf[pos >> 3] |= 1 << (pos & 7)
 
     def __contains__(self, key: str):
         for pos in self._hashes(key.encode('utf-8')):
-            if not (self.bitarr >> pos) & 1:
+            if not (self.buf[pos >> 3] >> (pos & 7)) & 1:
                 return False
         return True
 
     def to_bytes(self):
-        num_bytes = (self.m + 7)//8
-        return self.bitarr.to_bytes(num_bytes, 'big')
+        return bytes(self.buf)
 
     @classmethod
     def from_bytes(cls, b: bytes, m_bits=8192, k=6):
         bf = cls(m_bits=m_bits, k=k)
-        bf.bitarr = int.from_bytes(b, 'big')
+        bf.buf = bytearray(b)
         return bf
 
 class EnhancedIndexer:
@@ -96,114 +137,191 @@ class EnhancedIndexer:
         self.shard_size = shard_size
         self.bloom_m = bloom_m
         self.bloom_k = bloom_k
+        self._bloom_cache = None
+        self._postings_cache = {}
+        self._candidate_cache = {}
+        self._conn = None
+
+    def _get_conn(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA mmap_size=268435456")
+            conn.execute("PRAGMA cache_size=-65536")
+            self._conn = conn
+        return self._conn
 
     def build_index(self, chain):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
         if os.path.exists(self.db_path):
             os.remove(self.db_path)
         conn = sqlite3.connect(self.db_path)
         cur = conn.cursor()
         cur.execute("CREATE TABLE shards(shard_id INTEGER PRIMARY KEY, start_block INTEGER, end_block INTEGER, bloom BLOB)")
-        cur.execute("CREATE TABLE postings(address TEXT, shard_id INTEGER, postings BLOB, PRIMARY KEY(address, shard_id))")
+        # WITHOUT ROWID keeps the blob inside the (address, shard_id) B-tree,
+        # so the per-address scan below is a covering lookup
+        cur.execute("CREATE TABLE postings(address TEXT, shard_id INTEGER, postings BLOB, PRIMARY KEY(address, shard_id)) WITHOUT ROWID")
+        cur.execute("CREATE TABLE addr_shards(address TEXT PRIMARY KEY, shard_ids BLOB) WITHOUT ROWID")
         conn.commit()
-        shard_postings = defaultdict(lambda: defaultdict(list))
-        shard_blooms = {}
+        shard_blocks = defaultdict(list)
         for blk in chain:
+            shard_blocks[blk["block_number"] // self.shard_size].append(blk)
+        addr_shards = defaultdict(list)
+        with ProcessPoolExecutor() as pool:
+            futures = [pool.submit(self._build_shard, shard_id, blocks,
+                                   self.bloom_m, self.bloom_k)
+                       for shard_id, blocks in shard_blocks.items()]
+            for fut in futures:
+                shard_id, bloom_bytes, rows = fut.result()
+                start_block = shard_id * self.shard_size
+                end_block = start_block + self.shard_size - 1
+                cur.execute("INSERT INTO shards(shard_id, start_block, end_block, bloom) VALUES (?, ?, ?, ?)",
+                            (shard_id, start_block, end_block, bloom_bytes))
+                cur.executemany("INSERT INTO postings(address, shard_id, postings) VALUES (?, ?, ?)", rows)
+                for addr, _, _ in rows:
+                    if not addr.startswith("topic:"):
+                        addr_shards[addr].append(shard_id)
+        cur.executemany("INSERT INTO addr_shards(address, shard_ids) VALUES (?, ?)",
+                        [(addr, encode_shard_ids(sids)) for addr, sids in addr_shards.items()])
+        conn.commit()
+        conn.close()
+        self._bloom_cache = None
+        self._postings_cache = {}
+        self._candidate_cache = {}
+
+    @staticmethod
+    def _build_shard(shard_id, blocks, bloom_m, bloom_k):
+        # runs in a worker process: one shard's bloom + compressed postings.
+        # The AoS chain is flattened into parallel key/block arrays (SoA)
+        # once, then grouped per key with a single sort + np.unique.
+        bloom = BloomFilter(m_bits=bloom_m, k=bloom_k)
+        keys = []
+        blknums = []
+        for blk in blocks:
             blknum = blk["block_number"]
-            shard_id = blknum // self.shard_size
-            if shard_id not in shard_blooms:
-                shard_blooms[shard_id] = BloomFilter(m_bits=self.bloom_m, k=self.bloom_k)
             for tx in blk["transactions"]:
-                for addr in (tx["from"], tx["to"]):
-                    shard_postings[shard_id][addr].append(blknum)
-                    shard_blooms[shard_id].add(addr)
+                keys.append(tx["from"])
+                keys.append(tx["to"])
+                blknums.append(blknum)
+                blknums.append(blknum)
                 for topic in tx.get("topics", []):
-                    tkey = f"topic:{topic}"
-                    shard_postings[shard_id][tkey].append(blknum)
-                    shard_blooms[shard_id].add(tkey)
-        for shard_id, postings in shard_postings.items():
-            start_block = shard_id * self.shard_size
-            end_block = start_block + self.shard_size - 1
-            bloom_bytes = shard_blooms[shard_id].to_bytes()
-            cur.execute("INSERT INTO shards(shard_id, start_block, end_block, bloom) VALUES (?, ?, ?, ?)", 
-                        (shard_id, start_block, end_block, bloom_bytes))
-            for addr, blocks in postings.items():
-                blocks_sorted = sorted(set(blocks))
-                comp = compress_postings(blocks_sorted)
-                cur.execute("INSERT INTO postings(address, shard_id, postings) VALUES (?, ?, ?)", 
-                            (addr, shard_id, comp))
-        conn.commit()
-        conn.close()
+                    keys.append(topic_key(topic))
+                    blknums.append(blknum)
+        if not keys:
+            return shard_id, bloom.to_bytes(), []
+        key_arr = np.array(keys, object)
+        blk_arr = np.array(blknums, np.int64)
+        order = np.argsort(key_arr, kind="stable")
+        key_arr = key_arr[order]
+        blk_arr = blk_arr[order]
+        uniq, starts = np.unique(key_arr, return_index=True)
+        bounds = np.append(starts, len(key_arr))
+        rows = []
+        for i in range(len(uniq)):
+            # one bloom insertion per unique (shard, key), not per occurrence
+            bloom.add(uniq[i])
+            blks = np.unique(blk_arr[bounds[i]:bounds[i + 1]])
+            rows.append((uniq[i], shard_id, compress_postings(blks)))
+        return shard_id, bloom.to_bytes(), rows
+
+    def _load_blooms(self):
+        if self._bloom_cache is None:
+            cur = self._get_conn().cursor()
+            cur.execute("SELECT shard_id, bloom FROM shards ORDER BY shard_id")
+            rows = cur.fetchall()
+            shard_ids = np.array([sid for sid, _ in rows], np.int64)
+            if rows:
+                matrix = np.stack([np.frombuffer(blob, np.uint8) for _, blob in rows])
+            else:
+                matrix = np.empty((0, (self.bloom_m + 7) // 8), np.uint8)
+            self._bloom_cache = (shard_ids, matrix)
+        return self._bloom_cache
+
+    def bloom_probe_many(self, keys):
+        """Probe all shard blooms for several keys at once.
+
+        Outer loop runs over the hash index so each probe is one
+        vectorized bitwise-and over the whole bloom matrix column.
+        Returns {key: [candidate shard_ids]}.
+        """
+        shard_ids, matrix = self._load_blooms()
+        positions = {k: bloom_positions(k.encode('utf-8'), self.bloom_m, self.bloom_k)
+                     for k in keys}
+        alive = {k: np.ones(len(shard_ids), bool) for k in keys}
+        for i in range(self.bloom_k):
+            for k in keys:
+                a = alive[k]
+                if not a.any():
+                    continue
+                p = positions[k][i]
+                a &= (matrix[:, p >> 3] & (1 << (p & 7))) != 0
+        result = {k: shard_ids[alive[k]].tolist() for k in keys}
+        self._candidate_cache.update(result)
+        return result
 
     def postings_for(self, key: str):
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT shard_id, bloom FROM shards")
-        candidates = []
-        for shard_id, bloom_blob in cur.fetchall():
-            bf = BloomFilter.from_bytes(bloom_blob, m_bits=self.bloom_m, k=self.bloom_k)
-            if key in bf:
-                candidates.append(shard_id)
-        res = []
-        for sid in candidates:
-            cur.execute("SELECT postings FROM postings WHERE address = ? AND shard_id = ?", (key, sid))
-            r = cur.fetchone()
-            if r:
-                res.extend(decompress_postings(r[0]))
-        conn.close()
-        return sorted(res)
+        cached = self._postings_cache.get(key)
+        if cached is not None:
+            return cached
+        if key.startswith("topic:"):
+            candidates = self._candidate_cache.pop(key, None)
+            if candidates is None:
+                candidates = self.bloom_probe_many([key])[key]
+                self._candidate_cache.pop(key, None)
+        else:
+            # addresses have an exact shard map; no bloom false positives
+            cur = self._get_conn().cursor()
+            cur.execute("SELECT shard_ids FROM addr_shards WHERE address = ?", (key,))
+            row = cur.fetchone()
+            candidates = decode_shard_ids(row[0]) if row else []
+        blobs = []
+        if candidates:
+            cand = set(candidates)
+            cur = self._get_conn().cursor()
+            cur.execute("SELECT shard_id, postings FROM postings WHERE address = ? ORDER BY shard_id", (key,))
+            blobs = [blob for sid, blob in cur.fetchall() if sid in cand]
+        # shards are decoded in shard_id order and hold disjoint ascending
+        # block ranges, so the fused decode leaves out already sorted
+        out = np.empty(sum(postings_count(b) for b in blobs), np.uint32)
+        pos = 0
+        for blob in blobs:
+            pos = decode_postings_into(blob, out, pos)
+        self._postings_cache[key] = out
+        return out
 
     @staticmethod
-    def intersect_sorted(a: List[int], b: List[int]) -> List[int]:
-        i = j = 0
-        out = []
-        while i < len(a) and j < len(b):
-            if a[i] == b[j]:
-                out.append(a[i]); i += 1; j += 1
-            elif a[i] < b[j]:
-                i += 1
-            else:
-                j += 1
-        return out
+    def intersect_sorted(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        return np.intersect1d(a, b, assume_unique=True)
 
     @staticmethod
-    def merge_sorted(a: List[int], b: List[int]) -> List[int]:
-        i = j = 0; out = []
-        while i < len(a) and j < len(b):
-            if a[i] == b[j]:
-                out.append(a[i]); i += 1; j += 1
-            elif a[i] < b[j]:
-                out.append(a[i]); i += 1
-            else:
-                out.append(b[j]); j += 1
-        while i < len(a):
-            out.append(a[i]); i += 1
-        while j < len(b):
-            out.append(b[j]); j += 1
-        res = []
-        prev = None
-        for x in out:
-            if x != prev:
-                res.append(x); prev = x
-        return res
+    def merge_sorted(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        return np.union1d(a, b)
 
     def boolean_query(self, must_have: List[str]=[], any_of: List[str]=[]):
-        lists = []
-        for k in must_have:
-            lists.append(self.postings_for(k))
+        # resolve every topic term's shard candidates in one batched probe
+        pending = [k for k in dict.fromkeys(list(must_have) + list(any_of))
+                   if k.startswith("topic:") and k not in self._postings_cache]
+        if pending:
+            self.bloom_probe_many(pending)
+        lists = sorted((self.postings_for(k) for k in must_have), key=len)
         if lists:
+            # intersect smallest-first so cur shrinks as fast as possible
             cur = lists[0]
             for lst in lists[1:]:
+                if not len(cur):
+                    break
                 cur = self.intersect_sorted(cur, lst)
             required = cur
         else:
             required = None
-        any_list = []
+        any_list = np.empty(0, np.uint32)
         for k in any_of:
             any_list = self.merge_sorted(any_list, self.postings_for(k))
-        if required is None and any_list:
+        if required is None and len(any_list):
             return any_list
-        if required is None and not any_list:
-            return []
-        if required is not None and not any_list:
+        if required is None and not len(any_list):
+            return np.empty(0, np.uint32)
+        if required is not None and not len(any_list):
             return required
         return self.intersect_sorted(required, any_list)
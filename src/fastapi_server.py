@@ -13,6 +13,6 @@ INDEX = EnhancedIndexer(db_path="outputs/enhanced_index.db", shard_size=100, blo
 def query(req: QueryRequest):
     try:
         res = INDEX.boolean_query(must_have=req.must_have, any_of=req.any_of)
-        return {"count": len(res), "blocks": res[:200]}
+        return {"count": len(res), "blocks": [int(b) for b in res[:200]]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))